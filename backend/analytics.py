@@ -0,0 +1,334 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from dotenv import load_dotenv
+from snapshots import current_snapshot, load_snapshot, publish_snapshot, run_job
+
+# Load environment variables
+load_dotenv()
+
+# Snapshot configuration
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analytics_snapshots"))
+ANALYTICS_REFRESH_SECONDS = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "3600"))  # build job interval
+ANALYTICS_RETRY_SECONDS = int(os.getenv("ANALYTICS_RETRY_SECONDS", "60"))  # build job retry after a failed or empty build
+ANALYTICS_RELOAD_SECONDS = int(os.getenv("ANALYTICS_RELOAD_SECONDS", "60"))  # worker check for a new snapshot
+
+# Order item statuses that do not count as a sale
+EXCLUDED_STATUSES = ("Cancelled", "Returned")
+
+# Dimensions available for grouping and filtering
+DIMENSIONS = ("product", "category", "brand", "department", "gender", "week")
+METRICS = ("units", "revenue")
+
+# Phrases that turn a chat message into a ranking question. Matched on word
+# boundaries, and "top"/"best" only count when followed by what is being
+# ranked, so "a red top", "laptop bag" or "best price" are not rankings.
+# Lookaheads leave the ranked noun in place for product keyword matching.
+RANKING_PATTERN = re.compile(
+    r"\b(best[- ]?sell\w*|most (popular|sold|bought|ordered)|popular|trending|"
+    r"top(?=[- ](\d+|ten|five|three|selling|rated|brands?|sellers?|products?|items?|picks?|categor\w+|[a-z]{3,}s)\b)|"
+    r"best(?=\s+(?!price|deal|offer|option|way|match)[a-z]{3,}s\b))"
+)
+
+
+def _encode(values):
+    """Dictionary-encode a string column into (int32 codes, vocabulary)"""
+    codes, vocab = pd.factorize(pd.Series(values).fillna(""), sort=True)
+    return codes.astype(np.int32), [str(v) for v in vocab]
+
+
+def build_snapshot(engine, base_dir=ANALYTICS_DIR):
+    """Aggregate sales into columnar arrays and publish them as a new snapshot.
+
+    The fact table is pre-aggregated at (product, week, gender) grain with
+    units and revenue; product attributes are dictionary-encoded dimension
+    arrays, published with publish_snapshot so readers can memory-map them
+    and never see a partial build.
+
+    Run this from a single out-of-band job (python analytics.py), not from
+    the web workers: it scans order_items, and it prunes old snapshots.
+    Returns the snapshot directory, or None when there are no sales yet, so
+    an empty database never replaces a published snapshot.
+    """
+    started = time.perf_counter()
+    placeholders = ", ".join(f"'{s}'" for s in EXCLUDED_STATUSES)
+    with engine.connect() as conn:
+        products = pd.read_sql(text(
+            "SELECT id, name, category, brand, department, retail_price FROM products ORDER BY id"
+        ), conn)
+        sales = pd.read_sql(text(
+            "SELECT oi.product_id, oi.created_at, u.gender "
+            "FROM order_items oi LEFT JOIN users u ON u.id = oi.user_id "
+            f"WHERE oi.product_id IS NOT NULL AND (oi.status IS NULL OR oi.status NOT IN ({placeholders}))"
+        ), conn, parse_dates=["created_at"])
+
+    # Product dimension
+    product_ids = products["id"].to_numpy(dtype=np.int64)
+    category, category_vocab = _encode(products["category"])
+    brand, brand_vocab = _encode(products["brand"])
+    department, department_vocab = _encode(products["department"])
+    names = products["name"].fillna("").str.lower().to_numpy(dtype=str)
+    prices = products["retail_price"].fillna(0.0).to_numpy(dtype=np.float64)
+
+    # Fact table at (product, week, gender) grain
+    sales = sales[sales["product_id"].isin(product_ids) & sales["created_at"].notna()]
+    if sales.empty:
+        print("⚠️ Analytics snapshot skipped: no sales loaded")
+        return None
+    created = pd.to_datetime(sales["created_at"], utc=True).dt.tz_localize(None)
+    week_start = (created - pd.to_timedelta(created.dt.weekday, unit="D")).dt.normalize()
+    gender_codes, gender_vocab = _encode(sales["gender"])
+    facts = pd.DataFrame({
+        "product": np.searchsorted(product_ids, sales["product_id"].to_numpy(dtype=np.int64)).astype(np.int32),
+        "week": (week_start.to_numpy(dtype="datetime64[D]").astype(np.int64) // 7).astype(np.int32),
+        "gender": gender_codes.astype(np.int8),
+    })
+    facts = facts.groupby(["product", "week", "gender"], sort=True).size().rename("units").reset_index()
+    facts["revenue"] = facts["units"] * prices[facts["product"].to_numpy()]
+
+    arrays = {
+        "product_id": product_ids,
+        "product_name": names,
+        "product_category": category,
+        "product_brand": brand,
+        "product_department": department,
+        "fact_product": facts["product"].to_numpy(dtype=np.int32),
+        "fact_week": facts["week"].to_numpy(dtype=np.int32),
+        "fact_gender": facts["gender"].to_numpy(dtype=np.int8),
+        "fact_units": facts["units"].to_numpy(dtype=np.int32),
+        "fact_revenue": facts["revenue"].to_numpy(dtype=np.float64),
+    }
+    meta = {
+        "built_at": datetime.utcnow().isoformat(),
+        "products": int(len(product_ids)),
+        "order_items": int(len(sales)),
+        "fact_rows": int(len(facts)),
+        "vocab": {
+            "category": category_vocab,
+            "brand": brand_vocab,
+            "department": department_vocab,
+            "gender": gender_vocab,
+        },
+    }
+    final_dir = publish_snapshot(base_dir, arrays, meta)
+    name = os.path.basename(final_dir)
+    print(f"✅ Analytics snapshot {name} built: {meta['fact_rows']} fact rows from {meta['order_items']} order items in {time.perf_counter() - started:.1f}s")
+    return final_dir
+
+
+class AnalyticsSnapshot:
+    """Read-only, memory-mapped view of one published snapshot"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta, self.arrays = load_snapshot(path)
+        self.vocab = self.meta["vocab"]
+
+    def _codes(self, dimension, value):
+        """Vocabulary codes matching a case-insensitive filter value"""
+        value = value.lower()
+        return [i for i, v in enumerate(self.vocab[dimension]) if v.lower() == value]
+
+    def _fact_mask(self, category=None, brand=None, department=None, gender=None, name=None, weeks=None):
+        a = self.arrays
+        product_mask = np.ones(len(a["product_id"]), dtype=bool)
+        for dimension, value in (("category", category), ("brand", brand), ("department", department)):
+            if value:
+                product_mask &= np.isin(a[f"product_{dimension}"], self._codes(dimension, value))
+        if name:
+            product_mask &= np.char.find(a["product_name"], name.lower()) >= 0
+        mask = product_mask[a["fact_product"]]
+        if gender:
+            mask &= np.isin(a["fact_gender"], self._codes("gender", gender))
+        if weeks and len(a["fact_week"]):
+            mask &= a["fact_week"] > int(a["fact_week"].max()) - weeks
+        return mask
+
+    def weekly(self, k=12, **filters):
+        """Units and revenue for each of the latest k weeks, oldest first, after filters"""
+        a = self.arrays
+        if not len(a["fact_week"]):
+            return []
+        last = int(a["fact_week"].max())
+        first = max(int(a["fact_week"].min()), last - k + 1)
+        mask = self._fact_mask(**filters) & (a["fact_week"] >= first)
+        keys = a["fact_week"][mask] - first
+        size = last - first + 1
+        units = np.bincount(keys, weights=a["fact_units"][mask], minlength=size)
+        revenue = np.bincount(keys, weights=a["fact_revenue"][mask], minlength=size)
+        # fact_week is days-since-epoch // 7 of a Monday, and Mondays are day 4 mod 7
+        return [
+            {
+                "week": str(np.datetime64((first + i) * 7 + 4, "D")),
+                "units": int(units[i]),
+                "revenue": round(float(revenue[i]), 2),
+            }
+            for i in range(size)
+        ]
+
+    def top(self, by="product", k=10, metric="units", **filters):
+        """Top-k groups by units or revenue, after applying dimension filters.
+
+        by="week" returns the latest k weeks in chronological order instead,
+        for trends.
+        """
+        if by not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {by}")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if by == "week":
+            return self.weekly(k, **filters)
+        a = self.arrays
+        mask = self._fact_mask(**filters)
+        fact_product = a["fact_product"][mask]
+        if by == "gender":
+            keys = a["fact_gender"][mask]
+            labels = self.vocab["gender"]
+        elif by == "product":
+            keys = fact_product
+            labels = None
+        else:
+            keys = a[f"product_{by}"][fact_product]
+            labels = self.vocab[by]
+
+        size = len(labels) if labels is not None else len(a["product_id"])
+        units = np.bincount(keys, weights=a["fact_units"][mask], minlength=size)
+        revenue = np.bincount(keys, weights=a["fact_revenue"][mask], minlength=size)
+        values = units if metric == "units" else revenue
+
+        k = min(k, int(np.count_nonzero(values)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-values, k - 1)[:k]
+        top = top[np.argsort(-values[top], kind="stable")]
+
+        results = []
+        for idx in top:
+            entry = {"units": int(units[idx]), "revenue": round(float(revenue[idx]), 2)}
+            if by == "product":
+                entry.update({
+                    "product_id": int(a["product_id"][idx]),
+                    "name": str(a["product_name"][idx]),
+                    "category": self.vocab["category"][a["product_category"][idx]],
+                    "brand": self.vocab["brand"][a["product_brand"][idx]],
+                    "department": self.vocab["department"][a["product_department"][idx]],
+                })
+            else:
+                entry[by] = labels[idx]
+            results.append(entry)
+        return results
+
+
+class AnalyticsStore:
+    """Holds the current snapshot and swaps it when a newer one is published.
+
+    Workers only read: snapshots are built by the analytics job.
+    """
+
+    def __init__(self, base_dir=ANALYTICS_DIR):
+        self.base_dir = base_dir
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        """Load the published snapshot if it differs from the one in memory"""
+        path = current_snapshot(self.base_dir)
+        if not path:
+            return False
+        if self.snapshot is not None and self.snapshot.path == path:
+            return False
+        try:
+            snapshot = AnalyticsSnapshot(path)
+        except FileNotFoundError:
+            # Superseded and pruned between reading CURRENT and loading it;
+            # keep the snapshot in memory and pick up the newer one next time
+            return False
+        with self._lock:
+            self.snapshot = snapshot
+        return True
+
+    def watch(self, interval=ANALYTICS_RELOAD_SECONDS, stop_event=None):
+        """Reload now and whenever a new snapshot is published; meant for a daemon thread"""
+        stop_event = stop_event or threading.Event()
+        while True:
+            try:
+                if self.reload():
+                    print(f"✅ Analytics snapshot {os.path.basename(self.snapshot.path)} loaded")
+            except Exception as e:
+                print(f"❌ Error loading analytics snapshot: {e}")
+            if stop_event.wait(interval):
+                return
+
+    def status(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        meta = {k: v for k, v in snapshot.meta.items() if k != "vocab"}
+        return {"loaded": True, "snapshot": os.path.basename(snapshot.path), **meta}
+
+
+def mentions_ranking(message):
+    return RANKING_PATTERN.search(message.lower()) is not None
+
+
+def ranking_context(snapshot, message, product_keywords=(), k=5):
+    """Format best sellers relevant to a chat message as an LLM system prompt"""
+    if snapshot is None:
+        return ""
+    msg = message.lower()
+    # Drop the ranking phrase so "top jackets" filters on jackets while
+    # "best-selling tops" still filters on tops; whole words so "what" is not "hat"
+    item_words = RANKING_PATTERN.sub(" ", msg)
+    product_keyword = next(
+        (kw for kw in product_keywords if re.search(rf"\b{re.escape(kw)}s?\b", item_words)),
+        None,
+    )
+    department = None
+    if re.search(r"\b(women|woman|womens|women's|ladies|female)\b", msg):
+        department = "Women"
+    elif re.search(r"\b(men|man|mens|men's|male)\b", msg):
+        department = "Men"
+
+    if "brand" in msg:
+        rows = snapshot.top("brand", k, name=product_keyword, department=department)
+        if not rows:
+            return ""
+        lines = [f"- {r['brand']} ({r['units']} sold)" for r in rows]
+        heading = "Top-selling brands"
+    else:
+        rows = snapshot.top("product", k, name=product_keyword, department=department)
+        if not rows:
+            return ""
+        lines = [f"- {r['name'].title()} (Brand: {r['brand']}, {r['units']} sold)" for r in rows]
+        heading = "Best-selling products"
+    scope = " ".join(s for s in (department, product_keyword) if s)
+    return f"{heading}{' for ' + scope if scope else ''}:\n" + "\n".join(lines) + "\n"
+
+
+# Shared store for the whole worker process
+analytics_store = AnalyticsStore()
+
+
+def main():
+    """Build a snapshot for running workers to pick up, once or every N seconds.
+
+    With --every, a failed build (database not up, tables not created yet) or
+    an empty one is retried after ANALYTICS_RETRY_SECONDS instead.
+    """
+    import argparse
+    from database import engine
+    parser = argparse.ArgumentParser(description="Build the columnar sales analytics snapshot")
+    parser.add_argument("--every", type=int, default=None, metavar="SECONDS",
+                        help=f"Keep rebuilding on this interval (e.g. {ANALYTICS_REFRESH_SECONDS})")
+    args = parser.parse_args()
+
+    run_job(lambda: build_snapshot(engine), "analytics snapshot", args.every, ANALYTICS_RETRY_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import json
+import sys
+from main import ChatBatchItem, run_chat_batch, CHAT_BATCH_MAX_WORKERS
+
+def main():
+    """Replay chat requests from a JSONL file and write NDJSON results to stdout"""
+    parser = argparse.ArgumentParser(description="Run chat requests in bulk for evaluation and replay")
+    parser.add_argument("input", help="JSONL file with one chat request per line, optionally with session_key ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=CHAT_BATCH_MAX_WORKERS, help="Conversations processed in parallel")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        payloads = [ChatBatchItem(**json.loads(line)) for line in source if line.strip()]
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(f"🚀 Running {len(payloads)} chat requests with {args.workers} workers...", file=sys.stderr)
+    errors = 0
+    for result in run_chat_batch(payloads, args.workers):
+        if "error" in result:
+            errors += 1
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+    print(f"✅ Completed {len(payloads)} requests ({errors} errors)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
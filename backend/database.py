@@ -50,6 +50,36 @@ def test_connection():
         print(f"❌ Database connection failed: {e}")
         return False
 
+def table_size_bytes(table):
+    """On-disk size of a table including its indexes, or None if the database can't report it"""
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                return conn.execute(text("SELECT pg_total_relation_size(:t)"), {"t": table}).scalar()
+            if engine.dialect.name == "sqlite":
+                # dbstat is only available when SQLite is built with it
+                return conn.execute(
+                    text("SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = :t)"),
+                    {"t": table},
+                ).scalar()
+    except SQLAlchemyError:
+        return None
+    return None
+
+def database_size_bytes():
+    """On-disk size of the whole database, or None if the database can't report it"""
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                return conn.execute(text("SELECT pg_database_size(current_database())")).scalar()
+            if engine.dialect.name == "sqlite":
+                page_count = conn.execute(text("PRAGMA page_count")).scalar()
+                page_size = conn.execute(text("PRAGMA page_size")).scalar()
+                return page_count * page_size
+    except SQLAlchemyError:
+        return None
+    return None
+
 if __name__ == "__main__":
     # Test connection and create tables
     if test_connection():
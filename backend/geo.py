@@ -0,0 +1,303 @@
+import os
+import re
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sqlalchemy import text
+from snapshots import current_snapshot, load_snapshot, publish_snapshot, run_job
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Snapshot configuration: the geo job rebuilds every GEO_REFRESH_SECONDS and
+# retries every GEO_RETRY_SECONDS while no data is loaded; workers check for
+# a newly published snapshot every GEO_RELOAD_SECONDS
+GEO_DIR = os.getenv("GEO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geo_snapshots"))
+GEO_REFRESH_SECONDS = int(os.getenv("GEO_REFRESH_SECONDS", "3600"))
+GEO_RETRY_SECONDS = int(os.getenv("GEO_RETRY_SECONDS", "60"))
+GEO_RELOAD_SECONDS = int(os.getenv("GEO_RELOAD_SECONDS", "60"))
+
+# Whole words that make shipping/warehouse info relevant to a chat turn;
+# word boundaries keep "details" or "metallic" from matching "eta"
+SHIPPING_PATTERN = re.compile(
+    r"\b(ship(s|ped|ping|ment)?|deliver(y|ies|ed|ing)?|arriv(e|es|ed|al|ing)|"
+    r"warehouses?|distribution cent(er|re)s?|dispatch(ed)?|eta)\b"
+)
+
+
+def to_unit_xyz(lat, lon):
+    """Convert latitude/longitude in degrees to 3D points on the unit sphere"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    """Convert straight-line distance between unit vectors to great-circle km"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+class DistributionCenterIndex:
+    """KD-tree over distribution centers on unit-sphere coordinates.
+
+    Euclidean (chord) distance between unit vectors is monotonic in
+    great-circle distance, so the nearest neighbour in 3D is the nearest
+    center on the globe.
+    """
+
+    def __init__(self, ids, names, lats, lons):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.names = list(names)
+        self.tree = cKDTree(to_unit_xyz(lats, lons)) if len(self.ids) else None
+
+    @classmethod
+    def from_db(cls, conn):
+        rows = conn.execute(text(
+            "SELECT id, name, latitude, longitude FROM distribution_centers "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL ORDER BY id"
+        )).all()
+        return cls(
+            [r[0] for r in rows], [r[1] for r in rows],
+            [r[2] for r in rows], [r[3] for r in rows],
+        )
+
+    def nearest(self, lats, lons):
+        """Return (dc_ids, distances_km) for arrays of coordinates"""
+        if self.tree is None:
+            raise ValueError("No distribution centers with coordinates")
+        chord, idx = self.tree.query(to_unit_xyz(lats, lons), k=1)
+        return self.ids[idx], chord_to_km(chord)
+
+    def name(self, dc_id):
+        pos = np.searchsorted(self.ids, dc_id)
+        if pos < len(self.ids) and self.ids[pos] == dc_id:
+            return self.names[pos]
+        return None
+
+
+def assign_users(dc_index, engine, batch_size=50000):
+    """Assign every user with coordinates to the nearest distribution center.
+
+    Reads the users table in chunks and resolves each chunk with one
+    vectorized tree query. Returns a DataFrame indexed by user id with
+    dc_id and distance_km columns.
+    """
+    parts = []
+    query = text(
+        "SELECT id, latitude, longitude FROM users "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )
+    with engine.connect() as conn:
+        for chunk in pd.read_sql(query, conn, chunksize=batch_size):
+            if chunk.empty:
+                continue
+            dc_ids, dist = dc_index.nearest(chunk["latitude"].to_numpy(), chunk["longitude"].to_numpy())
+            parts.append(pd.DataFrame(
+                {"dc_id": dc_ids, "distance_km": dist.astype(np.float32)},
+                index=chunk["id"].to_numpy(dtype=np.int64),
+            ))
+    if not parts:
+        return pd.DataFrame({"dc_id": pd.Series(dtype=np.int64), "distance_km": pd.Series(dtype=np.float32)})
+    return pd.concat(parts)
+
+
+def delivery_time_stats(engine):
+    """Per-distribution-center delivery time distributions from historical order items.
+
+    Order items are attributed to the center of the product they ship.
+    Returns {dc_id: {"orders": n, "order_items": n, "processing_days": {...},
+    "transit_days": {...}, "total_days": {...}}} with p50/p90 percentiles for
+    each stage; orders counts distinct orders.
+    """
+    query = text(
+        "SELECT p.distribution_center_id AS dc_id, oi.order_id, oi.created_at, oi.shipped_at, oi.delivered_at "
+        "FROM order_items oi JOIN products p ON p.id = oi.product_id "
+        "WHERE oi.shipped_at IS NOT NULL AND p.distribution_center_id IS NOT NULL"
+    )
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, parse_dates=["created_at", "shipped_at", "delivered_at"])
+    if df.empty:
+        return {}
+
+    day = np.timedelta64(1, "D")
+    df["processing_days"] = (df["shipped_at"] - df["created_at"]) / day
+    df["transit_days"] = (df["delivered_at"] - df["shipped_at"]) / day
+    df["total_days"] = (df["delivered_at"] - df["created_at"]) / day
+
+    stats = {}
+    for dc_id, group in df.groupby("dc_id"):
+        entry = {"orders": int(group["order_id"].nunique()), "order_items": int(len(group))}
+        for col in ("processing_days", "transit_days", "total_days"):
+            values = group[col].to_numpy()
+            values = values[np.isfinite(values) & (values >= 0)]
+            if len(values):
+                p50, p90 = np.percentile(values, [50, 90])
+                entry[col] = {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "samples": int(len(values))}
+            else:
+                entry[col] = None
+        stats[int(dc_id)] = entry
+    return stats
+
+
+def build_snapshot(engine, base_dir=GEO_DIR):
+    """Assign users to distribution centers and publish the result as a snapshot.
+
+    Scans the users table and order_items, so run it from a single
+    out-of-band job (python geo.py), not from the web workers. Returns the
+    snapshot directory, or None when no distribution centers are loaded.
+    """
+    with engine.connect() as conn:
+        dc_index = DistributionCenterIndex.from_db(conn)
+    if dc_index.tree is None:
+        print("⚠️ Geo snapshot skipped: no distribution centers loaded")
+        return None
+    assignments = assign_users(dc_index, engine).sort_index()
+    dc_stats = delivery_time_stats(engine)
+    arrays = {
+        "user_id": assignments.index.to_numpy(dtype=np.int64),
+        "dc_id": assignments["dc_id"].to_numpy(dtype=np.int64),
+        "distance_km": assignments["distance_km"].to_numpy(dtype=np.float32),
+    }
+    meta = {
+        "built_at": datetime.utcnow().isoformat(),
+        "users": int(len(assignments)),
+        # JSON object keys are strings; GeoLookup converts them back to ints
+        "distribution_centers": {str(i): n for i, n in zip(dc_index.ids.tolist(), dc_index.names)},
+        "delivery": {str(i): s for i, s in dc_stats.items()},
+    }
+    path = publish_snapshot(base_dir, arrays, meta)
+    print(f"✅ Geo snapshot {os.path.basename(path)} built: {len(dc_index.ids)} distribution centers, {len(assignments)} users assigned")
+    return path
+
+
+class GeoLookup:
+    """Precomputed user -> distribution center assignments and delivery estimates.
+
+    Workers only read: the snapshot is built by the geo job and memory-mapped
+    here, so every worker shares the same pages instead of rebuilding.
+    """
+
+    def __init__(self, base_dir=GEO_DIR):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self.path = None
+        self.arrays = None
+        self.dc_names = {}
+        self.dc_stats = {}
+
+    @property
+    def ready(self):
+        return self.arrays is not None
+
+    def reload(self):
+        """Load the published snapshot if it differs from the one in memory"""
+        path = current_snapshot(self.base_dir)
+        if not path or path == self.path:
+            return False
+        try:
+            meta, arrays = load_snapshot(path)
+        except FileNotFoundError:
+            # Pruned between reading CURRENT and loading it; retry next time
+            return False
+        with self._lock:
+            self.path = path
+            self.arrays = arrays
+            self.dc_names = {int(k): v for k, v in meta["distribution_centers"].items()}
+            self.dc_stats = {int(k): v for k, v in meta["delivery"].items()}
+        return True
+
+    def watch(self, interval=GEO_RELOAD_SECONDS, stop_event=None):
+        """Reload now and whenever a new snapshot is published; meant for a daemon thread"""
+        stop_event = stop_event or threading.Event()
+        while True:
+            try:
+                if self.reload():
+                    print(f"✅ Geo snapshot {os.path.basename(self.path)} loaded")
+            except Exception as e:
+                print(f"❌ Error loading geo snapshot: {e}")
+            if stop_event.wait(interval):
+                return
+
+    def estimate(self, user_id):
+        """Return the nearest center and delivery estimate for a user, or None"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            if not self.ready:
+                return None
+            user_ids = self.arrays["user_id"]
+            pos = int(np.searchsorted(user_ids, user_id))
+            if pos >= len(user_ids) or user_ids[pos] != user_id:
+                return None
+            dc_id = int(self.arrays["dc_id"][pos])
+            return {
+                "user_id": user_id,
+                "distribution_center_id": dc_id,
+                "distribution_center": self.dc_names.get(dc_id),
+                "distance_km": round(float(self.arrays["distance_km"][pos]), 1),
+                "delivery": self.dc_stats.get(dc_id),
+            }
+
+    def shipping_context(self, user_id, dc_ids=()):
+        """Format a shipping estimate as an LLM system prompt line.
+
+        dc_ids are the distribution centers of the products being discussed;
+        items ship from there, so those are used when known. Otherwise the
+        customer's nearest warehouse is given, worded as an estimate.
+        """
+        with self._lock:
+            known = [(dc_id, self.dc_names[dc_id]) for dc_id in dict.fromkeys(dc_ids) if dc_id in self.dc_names]
+            stats = dict(self.dc_stats)
+        lines = []
+        if known:
+            for dc_id, name in known:
+                lines.append(f"Matching products ship from the {name} warehouse.")
+                total = (stats.get(dc_id) or {}).get("total_days")
+                if total:
+                    lines.append(
+                        f"Typical past delivery time from {name}: {total['p50']} days "
+                        f"(90% of order items within {total['p90']} days). This is an estimate, not a promise."
+                    )
+            return "\n".join(lines) + "\n"
+
+        est = self.estimate(user_id)
+        if not est:
+            return ""
+        lines.append(
+            f"Estimate only: the customer's nearest warehouse is {est['distribution_center']} "
+            f"(~{est['distance_km']:.0f} km away); items actually ship from the warehouse that stocks them."
+        )
+        total = (est["delivery"] or {}).get("total_days")
+        if total:
+            lines.append(
+                f"Typical past delivery time from there: {total['p50']} days "
+                f"(90% of order items within {total['p90']} days)."
+            )
+        return "\n".join(lines) + "\n"
+
+
+def mentions_shipping(message):
+    return SHIPPING_PATTERN.search(message.lower()) is not None
+
+
+# Shared lookup for the whole worker process
+geo_lookup = GeoLookup()
+
+
+def main():
+    """Build the geo snapshot for running workers to pick up, once or every N seconds"""
+    import argparse
+    from database import engine
+    parser = argparse.ArgumentParser(description="Build the user -> distribution center snapshot")
+    parser.add_argument("--every", type=int, default=None, metavar="SECONDS",
+                        help=f"Keep rebuilding on this interval (e.g. {GEO_REFRESH_SECONDS})")
+    args = parser.parse_args()
+    run_job(lambda: build_snapshot(engine), "geo snapshot", args.every, GEO_RETRY_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Gateway configuration
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-8b-8192")
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "3.0"))  # seconds
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "4"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10.0"))  # seconds
+
+
+class LLMOverloaded(Exception):
+    """Raised when a request cannot be admitted to the LLM gateway"""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LLMRateLimited(LLMOverloaded):
+    """Raised when the upstream provider answers with HTTP 429"""
+
+
+def _is_rate_limit_error(exc):
+    """Return True if the exception is an upstream 429"""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+class _Ticket:
+    """A queued request waiting for a concurrency slot"""
+
+    __slots__ = ("user_id", "enqueued_at", "granted")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class LLMGateway:
+    """Adaptive concurrency limiter with a fair per-user queue around LLM calls.
+
+    The limit grows additively while calls finish under the target latency and
+    shrinks multiplicatively on slow calls or upstream 429s (AIMD). Requests
+    beyond the limit wait in a per-user FIFO; users are served round-robin so
+    one chatty client cannot starve the others. When the queue is full or a
+    request waits too long, LLMOverloaded is raised instead of piling up.
+    """
+
+    def __init__(
+        self,
+        min_limit=LLM_MIN_CONCURRENCY,
+        max_limit=LLM_MAX_CONCURRENCY,
+        initial_limit=LLM_INITIAL_CONCURRENCY,
+        target_latency=LLM_TARGET_LATENCY,
+        max_queue=LLM_MAX_QUEUE,
+        max_queue_per_user=LLM_MAX_QUEUE_PER_USER,
+        queue_timeout=LLM_QUEUE_TIMEOUT,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queues = OrderedDict()  # user_id -> deque of _Ticket
+        self._queued = 0
+        self._client = None
+        self._client_key = None
+
+        # Counters for capacity planning
+        self._admitted = 0
+        self._completed = 0
+        self._rejected = {"queue_full": 0, "user_queue_full": 0, "timeout": 0}
+        self._rate_limited = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._latency_total = 0.0
+
+    # --- Admission control ---
+
+    def _has_capacity(self):
+        return self._in_flight < int(self.limit)
+
+    def _record_wait(self, waited):
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def _dispatch(self):
+        """Grant free slots to queued tickets, round-robin across users"""
+        granted = False
+        while self._queued and self._has_capacity():
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            ticket.granted = True
+            self._in_flight += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, user_id):
+        """Wait for a concurrency slot; raise LLMOverloaded if none is available in time"""
+        with self._cond:
+            if not self._queued and self._has_capacity():
+                self._in_flight += 1
+                self._admitted += 1
+                self._record_wait(0.0)
+                return
+
+            if self._queued >= self.max_queue:
+                self._rejected["queue_full"] += 1
+                raise LLMOverloaded("LLM queue is full", retry_after=self._retry_after())
+            user_queue = self._queues.get(user_id)
+            if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+                self._rejected["user_queue_full"] += 1
+                raise LLMOverloaded("Too many pending requests for this user", retry_after=self._retry_after())
+
+            ticket = _Ticket(user_id)
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+
+            deadline = ticket.enqueued_at + self.queue_timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            if not ticket.granted:
+                queue = self._queues.get(user_id)
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[user_id]
+                self._rejected["timeout"] += 1
+                raise LLMOverloaded("Timed out waiting for an LLM slot", retry_after=self._retry_after())
+
+            self._admitted += 1
+            self._record_wait(waited)
+
+    def release(self, latency, rate_limited=False):
+        """Free a slot and adapt the limit to the observed outcome"""
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            self._latency_total += latency
+            if rate_limited:
+                self._rate_limited += 1
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            elif latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._dispatch()
+
+    def _retry_after(self):
+        """Rough estimate, in whole seconds, of when a slot will free up"""
+        avg_latency = self._latency_total / self._completed if self._completed else self.target_latency
+        backlog = (self._queued + 1) / max(int(self.limit), 1)
+        return max(1, int(round(avg_latency * backlog)))
+
+    def fit_to_threadpool(self, total_threads, reserve=8):
+        """Cap the queue so waiting plus in-flight calls never exhaust the server threadpool.
+
+        Sync endpoints wait for a slot while holding a worker thread. If the
+        queue could hold more requests than there are threads, the threadpool
+        itself would become the unbounded queue and queue_full would never fire.
+        reserve keeps threads free for the other sync endpoints.
+        """
+        with self._cond:
+            self.max_queue = max(1, min(self.max_queue, total_threads - self.max_limit - reserve))
+            return self.max_queue
+
+    # --- Upstream call ---
+
+    def _get_client(self, api_key):
+        """Return a Groq client, reused across requests"""
+        if self._client is None or self._client_key != api_key:
+            from groq import Groq
+            self._client = Groq(api_key=api_key)
+            self._client_key = api_key
+        return self._client
+
+    def preload(self, api_key=None):
+        """Import the Groq SDK and build the client ahead of the first chat request"""
+        if api_key:
+            self._get_client(api_key)
+        else:
+            import groq  # noqa: F401
+
+    def complete(self, user_id, api_key, messages, max_tokens=256, temperature=0.7):
+        """Run a chat completion through the limiter and return the reply text"""
+        self.acquire(user_id)
+        start = time.monotonic()
+        rate_limited = False
+        try:
+            client = self._get_client(api_key)
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                rate_limited = True
+                with self._cond:
+                    retry_after = self._retry_after()
+                raise LLMRateLimited("Upstream LLM rate limit reached", retry_after=retry_after) from e
+            with self._cond:
+                self._errors += 1
+            raise
+        finally:
+            self.release(time.monotonic() - start, rate_limited=rate_limited)
+
+    # --- Metrics ---
+
+    def stats(self):
+        """Snapshot of limiter state for monitoring and capacity planning"""
+        with self._cond:
+            admitted = self._admitted
+            return {
+                "limit": round(self.limit, 2),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "queue_depth_by_user": {u: len(q) for u, q in self._queues.items()},
+                "admitted": admitted,
+                "completed": self._completed,
+                "rejected": dict(self._rejected),
+                "rate_limited": self._rate_limited,
+                "errors": self._errors,
+                "avg_wait_seconds": round(self._wait_total / admitted, 4) if admitted else 0.0,
+                "max_wait_seconds": round(self._wait_max, 4),
+                "avg_latency_seconds": round(self._latency_total / self._completed, 4) if self._completed else 0.0,
+            }
+
+
+# Shared gateway for the whole worker process
+gateway = LLMGateway()
@@ -1,8 +1,10 @@
+import numpy as np
 import pandas as pd
 import os
+import time
 from datetime import datetime
 from sqlalchemy.orm import Session
-from database import SessionLocal, create_tables, test_connection
+from database import SessionLocal, create_tables, test_connection, table_size_bytes, database_size_bytes
 from models import (
     DistributionCenter, Product, User, Order, OrderItem, InventoryItem
 )
@@ -199,40 +201,123 @@ def load_order_items(db: Session, csv_path: str):
     
     print(f"✅ Loaded {len(df)} order items")
 
-def load_inventory_items(db: Session, csv_path: str):
-    """Load inventory items data"""
-    print("📊 Loading inventory items...")
+# Denormalized inventory_items CSV columns and the products column each one copies
+INVENTORY_PRODUCT_COLUMNS = {
+    'product_category': 'category',
+    'product_name': 'name',
+    'product_brand': 'brand',
+    'product_retail_price': 'retail_price',
+    'product_department': 'department',
+    'product_sku': 'sku',
+    'product_distribution_center_id': 'distribution_center_id',
+}
+
+def verify_inventory_against_products(db: Session, df: pd.DataFrame):
+    """Compare the denormalized product columns with the products table.
+
+    Returns (missing, mismatches): missing is a boolean array marking rows
+    whose product is not loaded, and mismatches maps each inventory column
+    to a boolean array marking rows whose value differs from products.
+    Both are aligned with df.
+    """
+    products = pd.DataFrame(
+        db.query(Product.id, *[getattr(Product, c) for c in INVENTORY_PRODUCT_COLUMNS.values()]).all(),
+        columns=['product_id'] + list(INVENTORY_PRODUCT_COLUMNS.values()),
+    )
+    merged = df[['product_id'] + list(INVENTORY_PRODUCT_COLUMNS)].merge(
+        products, on='product_id', how='left', indicator=True
+    )
+    missing = (merged['_merge'] != 'both').to_numpy()
+
+    mismatches = {}
+    for inv_col, prod_col in INVENTORY_PRODUCT_COLUMNS.items():
+        left, right = merged[inv_col], merged[prod_col]
+        both_missing = left.isna() & right.isna()
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            equal = (left - right).abs() < 1e-6
+        else:
+            equal = left.astype(str) == right.astype(str)
+        mismatches[inv_col] = (~(equal | both_missing)).to_numpy() & ~missing
+    return missing, mismatches
+
+def load_inventory_items(db: Session, csv_path: str, storage: str = None):
+    """Load inventory items data.
+
+    In "compact" storage (default) a product_* value is only stored on the
+    row when it differs from the linked product or the product is missing;
+    otherwise it is read through product_id. "full" stores every product_*
+    value, reproducing the original denormalized layout as a size baseline.
+    """
+    storage = storage or os.getenv("INVENTORY_STORAGE", "compact")
+    if storage not in ("compact", "full"):
+        raise ValueError(f"Unknown INVENTORY_STORAGE: {storage}")
+    print(f"📊 Loading inventory items ({storage} storage)...")
+    started = time.perf_counter()
+    db_size_before = database_size_bytes()
     df = pd.read_csv(csv_path)
-    
+
+    # Work out which product_* values have to stay on the row
+    missing, mismatches = verify_inventory_against_products(db, df)
+    if missing.any():
+        print(f"⚠️ {int(missing.sum())} inventory items reference products that are not loaded; their product fields are kept on the row")
+    for col, mask in mismatches.items():
+        if mask.any():
+            print(f"⚠️ {int(mask.sum())} inventory items have {col} different from products; those values are kept on the row")
+    if not missing.any() and not any(mask.any() for mask in mismatches.values()):
+        print("✅ Inventory product columns are consistent with products")
+
+    kept = {}
+    for col, mask in mismatches.items():
+        keep = np.ones(len(df), dtype=bool) if storage == "full" else (mask | missing)
+        values = df[col].astype(object).where(df[col].notna() & keep, None)
+        if col == 'product_distribution_center_id':
+            values = values.map(lambda v: int(v) if v is not None else None)
+        kept[col] = values.to_numpy()
+    kept_cells = sum(int(pd.notna(values).sum()) for values in kept.values())
+
     batch_size = 1000
     for i in range(0, len(df), batch_size):
         batch = df.iloc[i:i+batch_size]
         inventory_items = [
-            InventoryItem(
-                id=int(row['id']),
-                product_id=int(row['product_id']) if pd.notna(row['product_id']) else None,
-                created_at=parse_datetime(row['created_at']),
-                sold_at=parse_datetime(row['sold_at']),
-                cost=float(row['cost']) if pd.notna(row['cost']) else None,
-                product_category=row['product_category'] if pd.notna(row['product_category']) else None,
-                product_name=row['product_name'] if pd.notna(row['product_name']) else None,
-                product_brand=row['product_brand'] if pd.notna(row['product_brand']) else None,
-                product_retail_price=float(row['product_retail_price']) if pd.notna(row['product_retail_price']) else None,
-                product_department=row['product_department'] if pd.notna(row['product_department']) else None,
-                product_sku=row['product_sku'] if pd.notna(row['product_sku']) else None,
-                product_distribution_center_id=int(row['product_distribution_center_id']) if pd.notna(row['product_distribution_center_id']) else None
-            )
-            for _, row in batch.iterrows()
+            {
+                'id': int(row.id),
+                'product_id': int(row.product_id) if pd.notna(row.product_id) else None,
+                'created_at': parse_datetime(row.created_at),
+                'sold_at': parse_datetime(row.sold_at),
+                'cost': float(row.cost) if pd.notna(row.cost) else None,
+                **{f"{col}_override": kept[col][i + j] for col in INVENTORY_PRODUCT_COLUMNS},
+            }
+            for j, row in enumerate(batch.itertuples(index=False))
         ]
         try:
-            db.bulk_save_objects(inventory_items)
+            db.bulk_insert_mappings(InventoryItem, inventory_items)
             db.commit()
             print(f"✅ Loaded batch {i//batch_size + 1} ({min(i+batch_size, len(df))}/{len(df)} inventory items)")
         except SQLAlchemyError as e:
             print(f"❌ Error loading inventory items: {e}")
             db.rollback()
-    
-    print(f"✅ Loaded {len(df)} inventory items")
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Loaded {len(df)} inventory items in {elapsed:.1f}s ({kept_cells} product_* values stored on rows)")
+    table_size = table_size_bytes(InventoryItem.__tablename__)
+    db_size_after = database_size_bytes()
+    if table_size is not None:
+        print(f"📉 inventory_items on disk: {table_size / 1e6:.1f} MB ({storage} storage)")
+    if db_size_before is not None and db_size_after is not None:
+        print(f"📉 Database size: {db_size_before / 1e6:.1f} MB before, {db_size_after / 1e6:.1f} MB after inventory items")
+    if storage == "compact":
+        print("ℹ️ Re-run with INVENTORY_STORAGE=full to measure the denormalized baseline")
+
+def refresh_snapshots():
+    """Rebuild the snapshots web workers read, so a new load shows up without waiting for the jobs"""
+    from database import engine
+    from analytics import build_snapshot as build_analytics_snapshot
+    from geo import build_snapshot as build_geo_snapshot
+    for label, build in (("Geo", build_geo_snapshot), ("Analytics", build_analytics_snapshot)):
+        try:
+            build(engine)
+        except Exception as e:
+            print(f"⚠️ {label} snapshot not rebuilt: {e}")
 
 def main():
     """Main function to load all data"""
@@ -268,6 +353,7 @@ def main():
         load_order_items(db, os.path.join(data_dir, "order_items.csv"))
         
         print("🎉 Data ingestion completed successfully!")
+        refresh_snapshots()
         
     except Exception as e:
         print(f"❌ Error during data ingestion: {e}")
@@ -1,11 +1,20 @@
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from database import get_db, create_tables
-from models import ConversationSession, ConversationMessage, User
+from database import get_db, create_tables, SessionLocal, engine
+from llm_gateway import gateway, LLMOverloaded
+from models import ConversationSession, ConversationMessage, User, Product
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import queue
+import re
+import threading
+import time
 
 app = FastAPI()
 
@@ -53,10 +62,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-def on_startup():
+@app.get("/api/llm/stats")
+def llm_stats():
+    return gateway.stats()
+
+# --- Startup, warm-up and health checks ---
+# Steps run in a background thread so the worker accepts connections
+# immediately; /readyz reports ready only once the required steps succeed.
+warmup_state = {"ready": False, "started_at": None, "finished_at": None, "steps": {}}
+warmup_lock = threading.Lock()
+
+def _warm_database():
     create_tables()
 
+def _warm_product_cache():
+    db = SessionLocal()
+    try:
+        for kw in PRODUCT_KEYWORDS:
+            find_products(db, kw, product_lookup_cache)
+    finally:
+        db.close()
+
+def _warm_geo_lookup():
+    # Workers only load the published snapshot; building it is the job of
+    # `python geo.py` so workers never scan users and order_items themselves
+    from geo import geo_lookup
+    threading.Thread(target=geo_lookup.watch, name="geo", daemon=True).start()
+
+def _warm_llm_client():
+    gateway.preload(os.getenv("GROQ_API_KEY"))
+
+def _warm_analytics():
+    # Workers only load the published snapshot; building it is the job of
+    # `python analytics.py` so workers never scan order_items themselves
+    from analytics import analytics_store
+    threading.Thread(target=analytics_store.watch, name="analytics", daemon=True).start()
+
+# (name, function, required for readiness)
+WARMUP_STEPS = [
+    ("database", _warm_database, True),
+    ("product_cache", _warm_product_cache, True),
+    ("geo_lookup", _warm_geo_lookup, False),
+    ("llm_client", _warm_llm_client, False),
+    ("analytics", _warm_analytics, False),
+]
+
+# Backoff for required steps that fail, e.g. the database is not accepting
+# connections yet: retry after 1s, doubling up to WARMUP_RETRY_MAX_SECONDS
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "1"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "30"))
+
+def run_warmup():
+    """Run warm-up steps in order, recording status and timing for /readyz.
+
+    Required steps are retried with backoff until they succeed, so a worker
+    started before its database is up becomes ready once the database is.
+    Optional steps run once.
+    """
+    with warmup_lock:
+        warmup_state["started_at"] = datetime.utcnow().isoformat()
+    for name, step, required in WARMUP_STEPS:
+        delay = WARMUP_RETRY_SECONDS
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.monotonic()
+            try:
+                step()
+                status = {"status": "ok"}
+            except Exception as e:
+                print(f"❌ Warm-up step {name} failed: {e}")
+                status = {"status": "error", "error": str(e)}
+            status["seconds"] = round(time.monotonic() - start, 3)
+            status["attempts"] = attempts
+            with warmup_lock:
+                warmup_state["steps"][name] = status
+            if status["status"] == "ok" or not required:
+                break
+            print(f"🔁 Retrying warm-up step {name} in {delay:g}s")
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+    with warmup_lock:
+        warmup_state["finished_at"] = datetime.utcnow().isoformat()
+        warmup_state["ready"] = True
+    print("✅ Warm-up complete, worker is ready")
+
+@app.on_event("startup")
+async def on_startup():
+    # Chat requests wait for an LLM slot inside the sync threadpool; keep the
+    # gateway queue smaller than the pool so overload is rejected, not piled up
+    import anyio
+    gateway.fit_to_threadpool(anyio.to_thread.current_default_thread_limiter().total_tokens)
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+# Health checks are async so they never wait behind a saturated threadpool
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Copy under the lock; the warm-up thread may still be adding steps
+    with warmup_lock:
+        state = {**warmup_state, "steps": {k: dict(v) for k, v in warmup_state["steps"].items()}}
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **state})
+    return {"status": "ready", **state}
+
+@app.get("/api/shipping/estimate")
+def shipping_estimate(user_id: str = Query(...)):
+    from geo import geo_lookup
+    estimate = geo_lookup.estimate(user_id)
+    if not estimate:
+        raise HTTPException(status_code=404, detail="No shipping estimate for this user")
+    return estimate
+
+# --- Read-only sales analytics over the columnar snapshot ---
+@app.get("/api/analytics/status")
+def analytics_status():
+    from analytics import analytics_store
+    return analytics_store.status()
+
+@app.get("/api/analytics/top")
+def analytics_top(
+    by: str = "product",
+    k: int = Query(10, ge=1, le=100),
+    metric: str = "units",
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    department: Optional[str] = None,
+    gender: Optional[str] = None,
+    name: Optional[str] = None,
+    weeks: Optional[int] = Query(None, ge=1),
+):
+    from analytics import analytics_store
+    snapshot = analytics_store.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Analytics snapshot not available yet")
+    try:
+        results = snapshot.top(
+            by, k, metric,
+            category=category, brand=brand, department=department,
+            gender=gender, name=name, weeks=weeks,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"by": by, "metric": metric, "snapshot": snapshot.meta["built_at"], "results": results}
+
 class ChatRequest(BaseModel):
     user_id: str
     message: str
@@ -68,30 +220,67 @@ class ChatResponse(BaseModel):
 
 @app.post("/api/chat", response_model=ChatResponse)
 def chat_endpoint(payload: ChatRequest, db: Session = Depends(get_db)):
-    # Find or create conversation session
+    return handle_chat(payload, db, product_lookup_cache)
+
+PRODUCT_KEYWORDS = ["shirt","cap","hat","swimsuit","bikini","shorts","jacket","jeans","pant","dress","skirt","top","t-shirt","blouse","sweater","hoodie","coat","scarf","sock","shoe","sandal","boot","glove","belt","bag","purse","wallet","watch","suit","blazer","vest","tie"]
+COLOR_PATTERN = re.compile(r"(red|blue|black|white|navy|khaki|olive|plaid|camo|solid|print|stripe|grey|gray|beige|brown|orange|gold|silver|ivory|maroon|teal|aqua|coral|mint|peach|lime|mustard|burgundy|charcoal|denim|tan|turquoise|magenta|cream|off[- ]white|multicolor|violet|indigo|bronze|rose|wine|cherry|lemon|emerald|sapphire|ruby|pearl|copper|blush|fuchsia|mauve|taupe|camel|sand|rust|slate|peacock|eggplant|orchid|mocha|espresso|latte|cobalt|sky|seafoam|forest|pine|sage|spruce|mint|apple|melon|berry|stone|ash|cloud|smoke|storm|shadow|dove|graphite|midnight|ocean|ice|frost|snow)", re.IGNORECASE)
+
+# Process-wide product lookup cache keyed by (keyword, color). Entries expire
+# after PRODUCT_CACHE_TTL seconds so a catalog (re)loaded by load_data.py while
+# the server runs is picked up; empty results are never cached.
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "300"))
+product_lookup_cache = {}
+
+def find_products(db: Session, message: str, product_cache: Optional[dict] = None):
+    """Look up up to 3 products matching the product keyword and color in a message.
+
+    Results are plain dicts so they can be shared across DB sessions through
+    product_cache, keyed by (keyword, color) and holding (expires_at, products).
+    """
+    user_msg = message.lower()
+    found = None
+    for kw in PRODUCT_KEYWORDS:
+        if kw in user_msg:
+            found = kw
+            break
+    color_match = COLOR_PATTERN.search(user_msg)
+    color = color_match.group(1) if color_match else None
+    if not found:
+        return []
+    key = (found, color)
+    cached = product_cache.get(key) if product_cache is not None else None
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    query = db.query(Product)
+    if color:
+        query = query.filter(Product.name.ilike(f"%{color}%"))
+    query = query.filter(Product.name.ilike(f"%{found}%"))
+    products = [
+        {
+            "name": p.name, "category": p.category, "brand": p.brand, "retail_price": p.retail_price,
+            "distribution_center_id": p.distribution_center_id,
+        }
+        for p in query.limit(3).all()
+    ]
+    if product_cache is not None and products:
+        product_cache[key] = (time.monotonic() + PRODUCT_CACHE_TTL, products)
+    return products
+
+def handle_chat(payload: ChatRequest, db: Session, product_cache: Optional[dict] = None) -> ChatResponse:
+    """Generate the AI reply to a user message, store both and return the full conversation.
+
+    Nothing is written until the reply is ready, so a request rejected by the
+    LLM gateway leaves no session or orphaned user message behind.
+    """
+    received_at = datetime.utcnow()
+    # Find existing conversation session
+    session = None
     if payload.conversation_id:
         session = db.query(ConversationSession).filter_by(id=payload.conversation_id).first()
         if not session:
             raise HTTPException(status_code=404, detail="Conversation not found")
-    else:
-        session = ConversationSession(user_id=payload.user_id)
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-
-    # Store user message
-    user_msg = ConversationMessage(
-        session_id=session.id,
-        role="user",
-        content=payload.message,
-        timestamp=datetime.utcnow()
-    )
-    db.add(user_msg)
-    db.commit()
 
     # Integrate Groq LLM for AI response
-    import os
-    from groq import Groq
     from dotenv import load_dotenv
     load_dotenv()
     
@@ -100,7 +289,9 @@ def chat_endpoint(payload: ChatRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Groq API key not set")
 
     # Gather conversation history for context
-    messages = db.query(ConversationMessage).filter_by(session_id=session.id).order_by(ConversationMessage.timestamp).all()
+    messages = []
+    if session:
+        messages = db.query(ConversationMessage).filter_by(session_id=session.id).order_by(ConversationMessage.timestamp).all()
     chat_history = [
         {"role": "assistant" if m.role == "ai" else m.role, "content": m.content} for m in messages
     ]
@@ -125,47 +316,56 @@ def chat_endpoint(payload: ChatRequest, db: Session = Depends(get_db)):
         ai_content = "Could you please clarify your request regarding our e-commerce services?"
     else:
         # --- Product lookup and context enrichment for demo ---
-        import re
-        from models import Product
-        product_keywords = ["shirt","cap","hat","swimsuit","bikini","shorts","jacket","jeans","pant","dress","skirt","top","t-shirt","blouse","sweater","hoodie","coat","scarf","sock","shoe","sandal","boot","glove","belt","bag","purse","wallet","watch","suit","blazer","vest","tie"]
-        user_msg = payload.message.lower()
-        found = None
-        for kw in product_keywords:
-            if kw in user_msg:
-                found = kw
-                break
-        color_match = re.search(r"(red|blue|black|white|navy|khaki|olive|plaid|camo|solid|print|stripe|grey|gray|beige|brown|orange|gold|silver|ivory|maroon|teal|aqua|coral|mint|peach|lime|mustard|burgundy|charcoal|denim|tan|turquoise|magenta|cream|off[- ]white|multicolor|violet|indigo|bronze|rose|wine|cherry|lemon|emerald|sapphire|ruby|pearl|copper|blush|fuchsia|mauve|taupe|camel|sand|rust|slate|peacock|eggplant|orchid|mocha|espresso|latte|cobalt|sky|seafoam|forest|pine|sage|spruce|mint|apple|melon|berry|stone|ash|cloud|smoke|storm|shadow|dove|graphite|midnight|ocean|ice|frost|snow)", user_msg, re.IGNORECASE)
-        color = color_match.group(1) if color_match else None
-        products = []
-        if found:
-            query = db.query(Product)
-            if color:
-                query = query.filter(Product.name.ilike(f"%{color}%"))
-            query = query.filter(Product.name.ilike(f"%{found}%"))
-            products = query.limit(3).all()
+        products = find_products(db, payload.message, product_cache)
         # Build product context for LLM
         product_context = ""
         if products:
             product_context = "Available products matching your request:\n"
             for p in products:
-                product_context += f"- {p.name} (Category: {p.category}, Brand: {p.brand}, Price: ${p.retail_price})\n"
+                product_context += f"- {p['name']} (Category: {p['category']}, Brand: {p['brand']}, Price: ${p['retail_price']})\n"
+        # Add the shipping warehouse (the products' own, else the nearest) and
+        # typical delivery times for shipping questions
+        from geo import geo_lookup, mentions_shipping
+        if mentions_shipping(payload.message):
+            product_context += geo_lookup.shipping_context(
+                payload.user_id, [p["distribution_center_id"] for p in products if p["distribution_center_id"]]
+            )
+        # Add best sellers from the analytics snapshot for ranking questions
+        from analytics import analytics_store, mentions_ranking, ranking_context
+        if mentions_ranking(payload.message):
+            product_context += ranking_context(analytics_store.snapshot, payload.message, PRODUCT_KEYWORDS)
         # Add product context as system prompt if any
         llm_messages = chat_history.copy()
         if product_context:
             llm_messages.insert(0, {"role": "system", "content": product_context})
-        # Call Groq LLM
-        client = Groq(api_key=GROQ_API_KEY)
+        # Call Groq LLM through the gateway; overload is reported, not stored
         try:
-            response = client.chat.completions.create(
-                model="llama3-8b-8192",
-                messages=[{"role": m["role"], "content": m["content"]} for m in llm_messages],
-                max_tokens=256,
-                temperature=0.7,
+            ai_content = gateway.complete(
+                payload.user_id,
+                GROQ_API_KEY,
+                [{"role": m["role"], "content": m["content"]} for m in llm_messages],
+            )
+        except LLMOverloaded as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Chat service is busy: {e.reason}. Please retry shortly.",
+                headers={"Retry-After": str(e.retry_after)},
             )
-            ai_content = response.choices[0].message.content
         except Exception as e:
             ai_content = f"[LLM error: {str(e)}]"
 
+    # Create the session if needed and store both messages together
+    if session is None:
+        session = ConversationSession(user_id=payload.user_id)
+        db.add(session)
+        db.flush()
+    user_msg = ConversationMessage(
+        session_id=session.id,
+        role="user",
+        content=payload.message,
+        timestamp=received_at
+    )
+    db.add(user_msg)
     ai_msg = ConversationMessage(
         session_id=session.id,
         role="ai",
@@ -181,3 +381,125 @@ def chat_endpoint(payload: ChatRequest, db: Session = Depends(get_db)):
         {"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()} for m in messages
     ]
     return ChatResponse(conversation_id=session.id, messages=messages_out)
+
+# --- Batch chat for bulk evaluation and replay ---
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "5000"))
+CHAT_BATCH_MAX_WORKERS = int(os.getenv("CHAT_BATCH_MAX_WORKERS", "4"))
+CHAT_BATCH_MAX_RETRIES = int(os.getenv("CHAT_BATCH_MAX_RETRIES", "3"))  # per item, on a busy LLM gateway
+
+class ChatBatchItem(ChatRequest):
+    # Client-side conversation key: items sharing it run in order as one
+    # conversation, reusing the conversation_id created by the first turn
+    session_key: Optional[str] = None
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatBatchItem]
+    max_workers: Optional[int] = None
+
+def run_chat_batch(payloads: List[ChatRequest], max_workers: int = CHAT_BATCH_MAX_WORKERS):
+    """Run many chat requests, yielding one result dict per item as it completes.
+
+    Items sharing a session_key (or, without one, a conversation_id) run
+    sequentially in submission order; the conversation created by the first
+    turn of a session_key is carried over to the following turns. A turn
+    rejected by a busy LLM gateway is retried after its Retry-After, up to
+    CHAT_BATCH_MAX_RETRIES times; once a turn fails, the remaining turns of
+    its session fail too rather than run without their context. Distinct
+    conversations run in parallel on up to max_workers threads. Product
+    lookups go through the shared cache and the LLM client is shared through
+    the gateway. Each result carries the item's index.
+
+    Closing the generator (e.g. the client disconnected) cancels every item
+    that has not started yet.
+    """
+    # Group items by conversation so order is preserved within a session
+    groups = {}
+    for index, payload in enumerate(payloads):
+        session_key = getattr(payload, "session_key", None)
+        if session_key:
+            key = ("session", session_key)
+        elif payload.conversation_id:
+            key = ("conversation", payload.conversation_id)
+        else:
+            key = ("new", index)
+        groups.setdefault(key, []).append((index, payload))
+
+    results = queue.Queue()
+    cancelled = threading.Event()
+
+    def run_item(index, payload, db):
+        """Run one turn, retrying while the LLM gateway is busy"""
+        for attempt in range(CHAT_BATCH_MAX_RETRIES + 1):
+            try:
+                response = handle_chat(payload, db, product_lookup_cache)
+                return {"index": index, **response.model_dump()}
+            except HTTPException as e:
+                db.rollback()
+                result = {"index": index, "status_code": e.status_code, "error": e.detail}
+                if e.status_code != 503 or attempt == CHAT_BATCH_MAX_RETRIES:
+                    return result
+                retry_after = float((e.headers or {}).get("Retry-After", 1))
+                if cancelled.wait(retry_after):
+                    return result
+            except Exception as e:
+                db.rollback()
+                return {"index": index, "status_code": 500, "error": str(e)}
+
+    def run_group(items):
+        done = 0
+        conversation_id = None
+        failed = False
+        db = SessionLocal()
+        try:
+            for index, payload in items:
+                if cancelled.is_set():
+                    break
+                if conversation_id and not payload.conversation_id:
+                    payload = payload.model_copy(update={"conversation_id": conversation_id})
+                if failed:
+                    # Running it would open a new conversation or skip context
+                    result = {"index": index, "status_code": 424, "error": "Previous turn in this session failed"}
+                else:
+                    result = run_item(index, payload, db)
+                    if "error" in result:
+                        failed = True
+                    else:
+                        conversation_id = result["conversation_id"]
+                if getattr(payload, "session_key", None):
+                    result["session_key"] = payload.session_key
+                results.put(result)
+                done += 1
+        finally:
+            # Never leave the consumer waiting on items this group could not run
+            error = "Batch cancelled" if cancelled.is_set() else "Batch worker failed"
+            for index, _ in items[done:]:
+                results.put({"index": index, "status_code": 500, "error": error})
+            db.close()
+
+    max_workers = max(1, min(max_workers, len(groups) or 1))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for items in groups.values():
+            executor.submit(run_group, items)
+        for _ in range(len(payloads)):
+            yield results.get()
+    finally:
+        # On GeneratorExit, stop groups between turns and drop queued groups
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.post("/api/chat/batch")
+def chat_batch_endpoint(payload: ChatBatchRequest):
+    if len(payload.requests) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {CHAT_BATCH_MAX_ITEMS} items")
+    max_workers = min(payload.max_workers or CHAT_BATCH_MAX_WORKERS, CHAT_BATCH_MAX_WORKERS)
+
+    def stream():
+        batch = run_chat_batch(payload.requests, max_workers)
+        try:
+            for result in batch:
+                yield json.dumps(result) + "\n"
+        finally:
+            batch.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, DDL, event, func, select
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -94,26 +95,80 @@ class OrderItem(Base):
     product = relationship("Product", back_populates="order_items")
     inventory_item = relationship("InventoryItem", back_populates="order_items")
 
+def _product_attribute(name):
+    """Expose a Product column on InventoryItem: the per-item override if set, else the product's value"""
+    override = f"product_{name}_override"
+
+    def fget(self):
+        value = getattr(self, override)
+        if value is not None:
+            return value
+        return getattr(self.product, name) if self.product is not None else None
+
+    def expr(cls):
+        product_value = select(getattr(Product, name)).where(Product.id == cls.product_id).scalar_subquery()
+        return func.coalesce(getattr(cls, override), product_value)
+
+    fget.__name__ = expr.__name__ = f"product_{name}"
+    return hybrid_property(fget, expr=expr)
+
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
     
+    # Compact storage: product_* fields are read through product_id. The
+    # product_* columns only hold values that differ from the linked product
+    # (or whose product is missing) and are NULL otherwise.
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('products.id'))
     created_at = Column(DateTime)
     sold_at = Column(DateTime)
     cost = Column(Float)
-    product_category = Column(String(255))
-    product_name = Column(String(255))
-    product_brand = Column(String(255))
-    product_retail_price = Column(Float)
-    product_department = Column(String(255))
-    product_sku = Column(String(255))
-    product_distribution_center_id = Column(Integer)
+    product_category_override = Column("product_category", String(255))
+    product_name_override = Column("product_name", String(255))
+    product_brand_override = Column("product_brand", String(255))
+    product_retail_price_override = Column("product_retail_price", Float)
+    product_department_override = Column("product_department", String(255))
+    product_sku_override = Column("product_sku", String(255))
+    product_distribution_center_id_override = Column("product_distribution_center_id", Integer)
+    
+    # Denormalized product fields, kept for existing readers. The product is
+    # joined-loaded with the item so reading these costs no extra query per
+    # row. Each one used in a filter adds a correlated subquery; when
+    # filtering on several, join Product and filter on its columns instead.
+    product_category = _product_attribute("category")
+    product_name = _product_attribute("name")
+    product_brand = _product_attribute("brand")
+    product_retail_price = _product_attribute("retail_price")
+    product_department = _product_attribute("department")
+    product_sku = _product_attribute("sku")
+    product_distribution_center_id = _product_attribute("distribution_center_id")
     
     # Relationships
-    product = relationship("Product", back_populates="inventory_items")
+    product = relationship("Product", back_populates="inventory_items", lazy="joined")
     order_items = relationship("OrderItem", back_populates="inventory_item")
 
+# Compatibility view with the original denormalized inventory_items layout,
+# for raw SQL readers and exports
+INVENTORY_ITEMS_VIEW = "inventory_items_full"
+_inventory_items_view_select = (
+    "SELECT i.id, i.product_id, i.created_at, i.sold_at, i.cost, "
+    "COALESCE(i.product_category, p.category) AS product_category, "
+    "COALESCE(i.product_name, p.name) AS product_name, "
+    "COALESCE(i.product_brand, p.brand) AS product_brand, "
+    "COALESCE(i.product_retail_price, p.retail_price) AS product_retail_price, "
+    "COALESCE(i.product_department, p.department) AS product_department, "
+    "COALESCE(i.product_sku, p.sku) AS product_sku, "
+    "COALESCE(i.product_distribution_center_id, p.distribution_center_id) AS product_distribution_center_id "
+    "FROM inventory_items i LEFT JOIN products p ON p.id = i.product_id"
+)
+event.listen(Base.metadata, "after_create", DDL(
+    f"CREATE VIEW IF NOT EXISTS {INVENTORY_ITEMS_VIEW} AS {_inventory_items_view_select}"
+).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "after_create", DDL(
+    f"CREATE OR REPLACE VIEW {INVENTORY_ITEMS_VIEW} AS {_inventory_items_view_select}"
+).execute_if(dialect="postgresql"))
+event.listen(Base.metadata, "before_drop", DDL(f"DROP VIEW IF EXISTS {INVENTORY_ITEMS_VIEW}"))
+
 # Models for conversation history
 class ConversationSession(Base):
     __tablename__ = "conversation_sessions"
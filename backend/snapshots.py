@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import numpy as np
+
+# Snapshots kept on disk; older ones are pruned after each publish
+KEEP_SNAPSHOTS = 2
+
+
+def publish_snapshot(base_dir, arrays, meta, keep=KEEP_SNAPSHOTS):
+    """Write arrays and meta to a new snapshot directory and make it current.
+
+    Every array is a plain .npy so readers can memory-map it. The snapshot is
+    written to a temporary directory, renamed into place and published by
+    atomically replacing the CURRENT pointer, so readers never see a partial
+    build. Returns the snapshot directory.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    name = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    tmp_dir = os.path.join(base_dir, f".{name}.tmp")
+    os.makedirs(tmp_dir)
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{key}.npy"), array)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    final_dir = os.path.join(base_dir, name)
+    os.rename(tmp_dir, final_dir)
+
+    pointer_tmp = os.path.join(base_dir, f".CURRENT.{name}")
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(base_dir, "CURRENT"))
+    snapshots = sorted(d for d in os.listdir(base_dir) if not d.startswith(".") and d != "CURRENT")
+    for old in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(base_dir, old), ignore_errors=True)
+    return final_dir
+
+
+def current_snapshot(base_dir):
+    """Path of the published snapshot, or None if nothing was published yet"""
+    try:
+        with open(os.path.join(base_dir, "CURRENT")) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(base_dir, name) if name else None
+
+
+def load_snapshot(path):
+    """Return (meta, {name: memory-mapped array}) for a snapshot directory"""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {
+        name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+        for name in os.listdir(path) if name.endswith(".npy")
+    }
+    return meta, arrays
+
+
+def run_job(build, label, every=None, retry_every=60):
+    """Run a snapshot build once, or forever every N seconds.
+
+    build returns a truthy value when it published a snapshot. After a
+    failure (e.g. the database is not up or the tables do not exist yet) or
+    a build skipped for lack of data, the next attempt comes after
+    retry_every seconds instead of the full interval.
+    """
+    while True:
+        try:
+            built = build()
+        except Exception as e:
+            if not every:
+                raise
+            print(f"❌ Error building {label}: {e}")
+            built = None
+        if not every:
+            return built
+        time.sleep(every if built else min(every, retry_every))
@@ -0,0 +1,92 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import AnalyticsSnapshot, AnalyticsStore, build_snapshot
+from models import Base, OrderItem, Product, User
+
+# (product_id, user_id, created_at, status); 2024-01-01 is a Monday
+SALES = [
+    (1, 10, datetime(2024, 1, 3), "Complete"),
+    (3, 20, datetime(2024, 1, 3), "Complete"),
+    (1, 10, datetime(2024, 1, 8), "Shipped"),
+    (1, 10, datetime(2024, 1, 14, 23, 30), "Complete"),
+    (1, 10, datetime(2024, 1, 22), "Complete"),
+    (2, 20, datetime(2024, 1, 22), "Complete"),
+    (3, 20, datetime(2024, 1, 23), "Processing"),
+    (1, 10, datetime(2024, 1, 24), "Cancelled"),
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all([
+            Product(id=1, name="Classic Jeans", category="Jeans", brand="Levi's", department="Women", retail_price=10.0, sku="a"),
+            Product(id=2, name="Running Top", category="Tops", brand="Nike", department="Men", retail_price=50.0, sku="b"),
+            Product(id=3, name="Slim Jeans", category="Jeans", brand="Nike", department="Men", retail_price=5.0, sku="c"),
+            User(id=10, gender="F"),
+            User(id=20, gender="M"),
+        ])
+        db.add_all([
+            OrderItem(id=i, product_id=p, user_id=u, created_at=t, status=s)
+            for i, (p, u, t, s) in enumerate(SALES, start=1)
+        ])
+        db.commit()
+    return engine
+
+
+@pytest.fixture
+def snapshot(engine, tmp_path):
+    return AnalyticsSnapshot(build_snapshot(engine, str(tmp_path / "snapshots")))
+
+
+def test_top_products_by_units_and_revenue(snapshot):
+    by_units = snapshot.top("product", 10)
+    assert [(r["product_id"], r["units"]) for r in by_units] == [(1, 4), (3, 2), (2, 1)]
+    assert by_units[0]["name"] == "classic jeans"
+    assert by_units[0]["brand"] == "Levi's"
+
+    by_revenue = snapshot.top("product", 2, metric="revenue")
+    assert [(r["product_id"], r["revenue"]) for r in by_revenue] == [(2, 50.0), (1, 40.0)]
+
+
+def test_top_groups_and_filters(snapshot):
+    assert [(r["brand"], r["units"]) for r in snapshot.top("brand", 10)] == [("Levi's", 4), ("Nike", 3)]
+    assert [r["product_id"] for r in snapshot.top("product", 10, category="jeans")] == [1, 3]
+    assert [r["product_id"] for r in snapshot.top("product", 10, gender="M")] == [3, 2]
+    assert [r["product_id"] for r in snapshot.top("product", 10, name="slim")] == [3]
+    assert snapshot.top("brand", 10, department="Women") == [{"units": 4, "revenue": 40.0, "brand": "Levi's"}]
+    assert snapshot.top("product", 10, brand="Adidas") == []
+
+
+def test_weekly_is_labelled_by_monday_oldest_first(snapshot):
+    weeks = snapshot.top("week", 4)
+    assert [(w["week"], w["units"]) for w in weeks] == [
+        ("2024-01-01", 2),
+        ("2024-01-08", 2),
+        ("2024-01-15", 0),
+        ("2024-01-22", 3),
+    ]
+    assert [w["week"] for w in snapshot.weekly(2)] == ["2024-01-15", "2024-01-22"]
+    assert [w["units"] for w in snapshot.weekly(4, brand="nike")] == [1, 0, 0, 2]
+
+
+def test_recent_weeks_filter(snapshot):
+    # Only the week of 2024-01-22 counts; every product sold once, so order among ties is free
+    assert sorted((r["product_id"], r["units"]) for r in snapshot.top("product", 10, weeks=1)) == [(1, 1), (2, 1), (3, 1)]
+
+
+def test_empty_database_is_not_published(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    Base.metadata.create_all(engine)
+    base_dir = str(tmp_path / "snapshots")
+    assert build_snapshot(engine, base_dir) is None
+    assert AnalyticsStore(base_dir).reload() is False
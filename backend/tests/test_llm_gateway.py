@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_gateway import LLMGateway, LLMOverloaded, LLMRateLimited
+
+
+def make_gateway(**kwargs):
+    options = dict(min_limit=1, max_limit=1, initial_limit=1, target_latency=1.0,
+                   max_queue=8, max_queue_per_user=4, queue_timeout=2.0)
+    options.update(kwargs)
+    return LLMGateway(**options)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+def start_waiter(gateway, user_id, order):
+    """Queue an acquire in a thread; on admission record it and release the slot"""
+    def run():
+        gateway.acquire(user_id)
+        order.append(user_id)
+        gateway.release(0.0)
+
+    depth = gateway.stats()["queue_depth"]
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_for(lambda: gateway.stats()["queue_depth"] == depth + 1)
+    return thread
+
+
+def test_admits_up_to_limit_without_queueing():
+    gateway = make_gateway(max_limit=2, initial_limit=2)
+    gateway.acquire("a")
+    gateway.acquire("b")
+    stats = gateway.stats()
+    assert stats["in_flight"] == 2
+    assert stats["queue_depth"] == 0
+
+
+def test_queued_users_are_served_round_robin():
+    gateway = make_gateway()
+    gateway.acquire("holder")
+    order = []
+    threads = [start_waiter(gateway, user, order) for user in ("a", "a", "a", "b")]
+
+    gateway.release(0.0)
+    for thread in threads:
+        thread.join(2.0)
+
+    assert order == ["a", "b", "a", "a"]
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_wait_timeout_rejects_and_cleans_up_queue():
+    gateway = make_gateway(queue_timeout=0.05)
+    gateway.acquire("holder")
+    with pytest.raises(LLMOverloaded):
+        gateway.acquire("a")
+    stats = gateway.stats()
+    assert stats["rejected"]["timeout"] == 1
+    assert stats["queue_depth"] == 0
+    assert stats["queue_depth_by_user"] == {}
+
+
+def test_full_queues_reject_immediately():
+    gateway = make_gateway(max_queue=2, max_queue_per_user=1)
+    gateway.acquire("holder")
+    order = []
+    threads = [start_waiter(gateway, "a", order)]
+
+    with pytest.raises(LLMOverloaded):
+        gateway.acquire("a")
+    assert gateway.stats()["rejected"]["user_queue_full"] == 1
+
+    threads.append(start_waiter(gateway, "b", order))
+    with pytest.raises(LLMOverloaded):
+        gateway.acquire("c")
+    assert gateway.stats()["rejected"]["queue_full"] == 1
+
+    gateway.release(0.0)
+    for thread in threads:
+        thread.join(2.0)
+    assert order == ["a", "b"]
+
+
+def test_limit_adapts_to_latency_and_rate_limits():
+    gateway = make_gateway(min_limit=1, max_limit=10, initial_limit=4, target_latency=1.0)
+
+    gateway.acquire("a")
+    gateway.release(0.1)
+    assert gateway.limit == pytest.approx(4.25)
+
+    gateway.acquire("a")
+    gateway.release(5.0)
+    assert gateway.limit == pytest.approx(4.25 * 0.9)
+
+    gateway.acquire("a")
+    gateway.release(0.1, rate_limited=True)
+    assert gateway.limit == pytest.approx(4.25 * 0.9 * 0.5)
+
+    for _ in range(5):
+        gateway.acquire("a")
+        gateway.release(0.1, rate_limited=True)
+    assert gateway.limit == 1
+
+
+def test_fit_to_threadpool_caps_queue():
+    gateway = make_gateway(max_limit=16, max_queue=64)
+    assert gateway.fit_to_threadpool(40) == 16
+
+
+class _RateLimitError(Exception):
+    status_code = 429
+
+
+class _FakeCompletions:
+    def __init__(self, error=None):
+        self.error = error
+
+    def create(self, **kwargs):
+        if self.error:
+            raise self.error
+        message = type("Message", (), {"content": "hello"})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+class _FakeClient:
+    def __init__(self, error=None):
+        self.chat = type("Chat", (), {"completions": _FakeCompletions(error)})
+
+
+def test_complete_returns_reply_and_frees_slot():
+    gateway = make_gateway()
+    gateway._client, gateway._client_key = _FakeClient(), "key"
+    assert gateway.complete("a", "key", [{"role": "user", "content": "hi"}]) == "hello"
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_complete_maps_upstream_429_and_backs_off():
+    gateway = make_gateway(max_limit=8, initial_limit=8)
+    gateway._client, gateway._client_key = _FakeClient(_RateLimitError()), "key"
+    with pytest.raises(LLMRateLimited):
+        gateway.complete("a", "key", [{"role": "user", "content": "hi"}])
+    stats = gateway.stats()
+    assert stats["rate_limited"] == 1
+    assert stats["in_flight"] == 0
+    assert gateway.limit == 4
@@ -0,0 +1,88 @@
+import os
+import sys
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import load_data
+from models import Base, InventoryItem, Product
+
+COLUMNS = [
+    "id", "product_id", "created_at", "sold_at", "cost", "product_category", "product_name",
+    "product_brand", "product_retail_price", "product_department", "product_sku",
+    "product_distribution_center_id",
+]
+
+ROWS = [
+    # Matches its product: nothing kept on the row
+    (1, 1, "2024-01-01 10:00:00 UTC", None, 4.0, "Jeans", "Classic Jeans", "Levi's", 10.0, "Women", "sku-1", 1),
+    # Brand and price differ from the product: only those are kept
+    (2, 1, "2024-01-02 10:00:00 UTC", None, 4.0, "Jeans", "Classic Jeans", "Levi Strauss", 12.5, "Women", "sku-1", 1),
+    # Product 99 is not loaded: every value is kept
+    (3, 99, "2024-01-03 10:00:00 UTC", None, 7.0, "Tops", "Lost Top", "Acme", 20.0, "Men", "sku-99", 2),
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Size reporting reads the app's configured database; not under test here
+    monkeypatch.setattr(load_data, "table_size_bytes", lambda table: None)
+    monkeypatch.setattr(load_data, "database_size_bytes", lambda: None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Product(
+            id=1, name="Classic Jeans", category="Jeans", brand="Levi's", retail_price=10.0,
+            department="Women", sku="sku-1", distribution_center_id=1,
+        ))
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "inventory_items.csv"
+    pd.DataFrame(ROWS, columns=COLUMNS).to_csv(path, index=False)
+    return str(path)
+
+
+def test_compact_keeps_only_values_that_differ_or_lack_a_product(db, csv_path):
+    load_data.load_inventory_items(db, csv_path, storage="compact")
+    db.expire_all()
+    matching, mismatching, orphan = (db.get(InventoryItem, i) for i in (1, 2, 3))
+
+    assert matching.product_brand_override is None
+    assert matching.product_sku_override is None
+    assert matching.product_brand == "Levi's"
+    assert matching.product_retail_price == 10.0
+
+    assert mismatching.product_brand_override == "Levi Strauss"
+    assert mismatching.product_retail_price_override == 12.5
+    assert mismatching.product_name_override is None
+    assert mismatching.product_brand == "Levi Strauss"
+    assert mismatching.product_retail_price == 12.5
+    assert mismatching.product_name == "Classic Jeans"
+
+    assert orphan.product is None
+    assert (orphan.product_name, orphan.product_brand, orphan.product_sku) == ("Lost Top", "Acme", "sku-99")
+    assert orphan.product_retail_price == 20.0
+    assert orphan.product_distribution_center_id == 2
+
+
+def test_compact_values_match_the_full_layout_through_the_view(db, csv_path):
+    load_data.load_inventory_items(db, csv_path, storage="compact")
+    query = text(
+        "SELECT id, product_category, product_name, product_brand, product_retail_price, "
+        "product_department, product_sku, product_distribution_center_id FROM inventory_items_full ORDER BY id"
+    )
+    rows = [tuple(r) for r in db.execute(query)]
+    assert rows == [(r[0], *r[5:]) for r in ROWS]
+
+
+def test_full_storage_keeps_every_value(db, csv_path):
+    load_data.load_inventory_items(db, csv_path, storage="full")
+    db.expire_all()
+    assert db.get(InventoryItem, 1).product_brand_override == "Levi's"